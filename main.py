@@ -1,8 +1,120 @@
+import functools
+import queue
+import threading
+
 import numpy as np
-import sounddevice as sd
 import tkinter as tk
 from tkinter import ttk
-from scipy import signal
+
+# sounddevice and numba are slow to import, so neither is imported at module
+# load: sounddevice is imported in toggle_playback, and numba on a background
+# thread (see load_kernel). That way the window appears and stays responsive
+# while the audio subsystem is initialized.
+
+# Full scale of the int16 samples we hand to the sound device.
+_INT16_SCALE = 32767.0
+
+
+def _fill_brown(outdata_flat, leak, b_vol, y_prev, u1, u2):
+    """
+    Fill the int16 array outdata_flat with a block of brown noise in a
+    single pass.
+
+    Each pair of uniforms (u1[i], u2[i]) gives two white samples via
+    Box-Muller, so u1 and u2 hold half as many values as the block. Each
+    sample is run through the one-pole leaky integrator
+    y[n] = b_vol*x[n] + leak*y[n-1], quantized to int16 and written straight
+    into the output, so no intermediate arrays are created. The filter is
+    linear, so b_vol = (1 - leak) * volume * 32767 folds the volume and the
+    int16 full scale into its numerator.
+
+    Returns the last filter output (in int16 units), which is the state to
+    pass in as y_prev for the next block.
+    """
+    y = y_prev
+    for i in range(outdata_flat.shape[0] // 2):
+        # u1 is in [0, 1); use 1 - u1 so the log never sees zero.
+        r = np.sqrt(-2.0 * np.log(1.0 - u1[i]))
+        theta = 2.0 * np.pi * u2[i]
+        y = b_vol * r * np.cos(theta) + leak * y
+        outdata_flat[2 * i] = min(max(y, -32768.0), 32767.0)
+        y = b_vol * r * np.sin(theta) + leak * y
+        outdata_flat[2 * i + 1] = min(max(y, -32768.0), 32767.0)
+    return y
+
+
+def _compile_fill_brown():
+    """
+    Return _fill_brown compiled with Numba, or None if numba isn't installed.
+    
+    Numba is optional: without it render_block falls back to a vectorized
+    NumPy path.
+    """
+    try:
+        from numba import njit
+    except ImportError:
+        return None
+    return njit(cache=True, nogil=True)(_fill_brown)
+
+
+def _leak_from_bass(bass_value):
+    """
+    Map a bass slider value (20–200) to the leak coefficient (0.95–0.999).
+    
+    A plain affine map with clamping (no np.interp), returned as a Python
+    float so the kernel receives it as a scalar constant.
+    """
+    t = (bass_value - 20.0) / 180.0
+    t = 0.0 if t < 0.0 else (1.0 if t > 1.0 else t)
+    return 0.95 + t * (0.999 - 0.95)
+
+
+def _aligned_empty(n, dtype=np.float32, align=64):
+    """
+    Return an uninitialized 1-D array of n elements whose data starts on an
+    align-byte boundary, so SIMD loops (np.log, np.cos, ...) don't straddle
+    cache lines. NumPy itself only guarantees 16-byte alignment.
+    """
+    dtype = np.dtype(dtype)
+    nbytes = n * dtype.itemsize
+    raw = np.empty(nbytes + align, dtype=np.uint8)
+    offset = -raw.ctypes.data % align
+    return raw[offset:offset + nbytes].view(dtype)
+
+
+# Longest block the NumPy closed-form filter handles in one go. leak**-k must
+# stay within float32 range: 0.95**-1024 is about 6e22.
+_CLOSED_FORM_CHUNK = 1024
+
+
+@functools.lru_cache(maxsize=64)
+def _closed_form_tables(leak, n):
+    """
+    Return the read-only tables (leak**-k, leak**k, leak**(k+1)) for k in
+    range(n), used by the NumPy fallback filter.
+    
+    Over a chunk of n samples the recursion y[n] = b*x[n] + leak*y[n-1]
+    unrolls to
+      y[n] = leak**(n+1) * y[-1] + leak**n * sum_k leak**-k * (b*x[k])
+    so a chunk is one multiply, one cumsum and two more multiplies (b is
+    applied when the white noise is generated).
+    """
+    k = np.arange(n)
+    inv_pow = _aligned_empty(n)
+    inv_pow[:] = leak ** -k
+    pow_ = _aligned_empty(n)
+    pow_[:] = leak ** k
+    a_pow = _aligned_empty(n)
+    a_pow[:] = leak ** (k + 1)
+    # The tables are shared between every caller asking for the same key.
+    for table in (inv_pow, pow_, a_pow):
+        table.flags.writeable = False
+    return inv_pow, pow_, a_pow
+
+
+# How many blocks the producer thread may render ahead of the audio callback.
+_PREFETCH_BLOCKS = 4
+
 
 class BrownNoiseGenerator:
     def __init__(self):
@@ -17,19 +129,55 @@ class BrownNoiseGenerator:
         self.device = 4  # Change this to your desired device ID
         self.is_playing = False  # Start with playback off
         self.volume = 0.5
+        # Frames per block. Rendering a block is cheap, so a small block with
+        # low latency is fine; the device may still raise it (see
+        # toggle_playback).
+        self.blocksize = 256
+        # SFC64 is the fastest of NumPy's bit generators, and a Generator
+        # writes float32 directly into our buffers, unlike the legacy
+        # np.random.randn which produces float64.
+        self._rng = np.random.Generator(np.random.SFC64())
+        # The audio RNG above belongs to the producer thread; the GUI thread
+        # gets its own, so neither touches np.random's global state.
+        self._gui_rng = np.random.default_rng()
 
         # We use a one‐pole leaky integrator to produce brown noise.
         # Its transfer function is: H(z) = (1 - leak) / (1 - leak*z⁻¹)
         # (When leak is very close to 1, this approximates an integrator.)
-        # We store the filter state (zi) to ensure continuity between callback blocks.
-        self.zi = np.array([0], dtype=np.float32)
+        # We store the filter state (the last output sample) to ensure
+        # continuity between callback blocks.
+        self.zi_scalar = 0.0
         
         # Default bass level slider value.
         self.bass_level = 100  
+        self._last_bass = None
+
+        # The compiled noise kernel, or None for the NumPy fallback. It is
+        # compiled on a background thread (see load_kernel).
+        self._fill_brown = None
+        
         self.update_leak_from_bass(self.bass_level)
         
         # Create the GUI elements
         self.create_gui()
+        self._kernel_loader = threading.Thread(target=self.load_kernel,
+                                               daemon=True)
+        self._kernel_loader.start()
+
+    def load_kernel(self):
+        """
+        Import numba and compile the noise kernel, then publish it.
+        
+        Runs once on the _kernel_loader thread, so the Tk thread never
+        blocks on the import or the JIT; toggle_playback waits for it.
+        """
+        self._fill_brown = _compile_fill_brown()
+        if self._fill_brown is not None:
+            # Compile now so the first rendered block doesn't stall.
+            warmup = np.zeros(1, dtype=np.float32)
+            self._fill_brown(np.zeros(1, dtype=np.int16), self.leak, 0.0, 0.0,
+                             warmup, warmup)
+        self._publish_params()
 
     def create_gui(self):
         # --- Volume control ---
@@ -100,13 +248,14 @@ class BrownNoiseGenerator:
     
     def update_volume(self, value):
         self.volume = float(value) / 100.0
+        self._publish_params()
 
     def update_bass(self, value):
         # Convert value to float (it may come as a string from the slider)
         self.bass_level = float(value)
         self.update_leak_from_bass(self.bass_level)
         # (Optional) Reset the filter state if you want the noise to restart:
-        # self.zi = np.array([0], dtype=np.float32)
+        # self.zi_scalar = 0.0
     
     def update_leak_from_bass(self, bass_value):
         """
@@ -118,10 +267,36 @@ class BrownNoiseGenerator:
           - bass_value=20   → leak=0.95 (bright sound)
           - bass_value=200  → leak=0.999 (deep, smooth noise)
         """
-        self.leak = np.interp(bass_value, [20, 200], [0.95, 0.999])
-        # Precompute filter coefficients for the one–pole filter:
-        self.b_coef = np.array([1 - self.leak], dtype=np.float32)
-        self.a_coef = np.array([1, -self.leak], dtype=np.float32)
+        # Slider drags fire this many times per second; skip the work when
+        # the value hasn't meaningfully changed.
+        rounded = round(bass_value, 2)
+        if rounded == self._last_bass:
+            return
+        self._last_bass = rounded
+        
+        self.leak = _leak_from_bass(bass_value)
+        self.one_minus_leak = 1.0 - self.leak
+        # Look up the closed-form tables for the NumPy fallback; presets and
+        # revisited slider positions are served from the cache.
+        self._inv_pow, self._pow, self._a_pow = _closed_form_tables(
+            round(self.leak, 5), min(self.blocksize, _CLOSED_FORM_CHUNK))
+        self._publish_params()
+    
+    def _publish_params(self):
+        """
+        Hand the current filter and volume settings to the audio thread.
+        
+        The GUI thread never mutates what it has already published: it builds
+        a new tuple (the tables in it are read-only) and swaps the reference,
+        which is atomic. The producer thread reads the tuple once per block,
+        so it always sees a consistent set of parameters.
+        
+        Volume is folded into the filter numerator b_vol (along with the
+        int16 full scale), so rendering needs no separate volume pass.
+        """
+        self._b_vol = self.one_minus_leak * self.volume * _INT16_SCALE
+        self._params = (self.leak, self._b_vol, self._fill_brown,
+                        self._inv_pow, self._pow, self._a_pow)
     
     def set_preset(self, value):
         """Set the bass slider to a preset value and update accordingly."""
@@ -130,37 +305,174 @@ class BrownNoiseGenerator:
     
     def random_preset(self):
         """Set a random bass value between 20 and 200."""
-        value = np.random.uniform(20, 200)
+        value = self._gui_rng.uniform(20, 200)
         self.bass_slider.set(value)
         self.update_bass(value)
     
+    def render_block(self, block):
+        """
+        Render the next block of brown noise into the 1-D int16 array block.
+        
+        Runs on the producer thread, which owns the RNG, the scratch buffers
+        and the filter state.
+        """
+        # Take one consistent snapshot of the GUI-controlled parameters.
+        leak, b_vol, kernel, inv_pow, pow_, a_pow = self._params
+        
+        # Refill the uniforms that feed the Box-Muller transform in one call;
+        # _u1 and _u2 are the two halves of _u.
+        self._rng.random(out=self._u, dtype=np.float32)
+        
+        if kernel is not None:
+            # Generate, filter and scale the block in a single pass.
+            # The kernel returns the updated filter state.
+            self.zi_scalar = kernel(block, leak, b_vol, self.zi_scalar,
+                                    self._u1, self._u2)
+        else:
+            # Box-Muller into the preallocated buffer: the cosine half of
+            # each pair fills the first half of the block, the sine half the
+            # second. u1 is in [0, 1); use 1 - u1 so the log never sees zero.
+            # Scaling the log by b_vol**2 makes the radius, and so the white
+            # noise, come out already multiplied by the filter numerator.
+            frames = block.shape[0]
+            half = frames // 2
+            np.subtract(1.0, self._u1, out=self._u1)
+            np.log(self._u1, out=self._r)
+            np.multiply(self._r, -2.0 * b_vol * b_vol, out=self._r)
+            np.sqrt(self._r, out=self._r)
+            np.multiply(self._u2, 2.0 * np.pi, out=self._u2)
+            np.cos(self._u2, out=self._white[:half])
+            np.sin(self._u2, out=self._white[half:])
+            np.multiply(self._white[:half], self._r, out=self._white[:half])
+            np.multiply(self._white[half:], self._r, out=self._white[half:])
+            # Pass the white noise through the one–pole leaky integrator,
+            # in place and one chunk at a time, using the closed form.
+            n = inv_pow.shape[0]
+            for start in range(0, frames, n):
+                chunk = self._white[start:start + n]
+                m = chunk.shape[0]
+                np.multiply(chunk, inv_pow[:m], out=chunk)
+                np.cumsum(chunk, out=chunk)
+                np.multiply(chunk, pow_[:m], out=chunk)
+                decay = self._brown[start:start + m]
+                np.multiply(a_pow[:m], self.zi_scalar, out=decay)
+                np.add(chunk, decay, out=chunk)
+                self.zi_scalar = float(chunk[-1])
+            # Quantize to int16.
+            np.clip(self._white, -32768.0, 32767.0, out=self._white)
+            np.copyto(block, self._white, casting='unsafe')
+    
+    def produce_blocks(self):
+        """Keep the ready queue topped up with rendered blocks while playing."""
+        reported_underflows = 0
+        while self.is_playing:
+            # The callback only counts underflows; report them from here,
+            # where printing can't hold up the audio thread.
+            underflows = self._underflows
+            if underflows != reported_underflows:
+                print(f"Output underflow: producer thread fell behind "
+                      f"({underflows} blocks so far)")
+                reported_underflows = underflows
+            try:
+                block = self._free_blocks.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            self.render_block(block)
+            self._ready_blocks.put(block)
+    
     def audio_callback(self, outdata, frames, time, status):
         if status:
             print(status)
         
-        # Generate a block of white noise samples (float32)
-        white = np.random.randn(frames).astype(np.float32)
-        # Pass the white noise through the one–pole leaky integrator.
-        # signal.lfilter returns both the filtered output and the updated filter state.
-        brown, self.zi = signal.lfilter(self.b_coef, self.a_coef, white, zi=self.zi)
+        # The blocks are sized for exactly one callback (which must be even,
+        # since Box-Muller yields samples in pairs); we request a fixed
+        # blocksize, so anything else means the stream is misconfigured.
+        if frames != self.blocksize:
+            raise RuntimeError(
+                f"Expected {self.blocksize} frames per block, got {frames}")
         
-        # Apply volume and send the data to the output stream.
-        outdata[:] = (brown * self.volume).reshape(-1, 1)
+        # The noise is rendered ahead of time by the producer thread, so all
+        # that's left here is a copy.
+        try:
+            block = self._ready_blocks.get_nowait()
+        except queue.Empty:
+            self._underflows += 1
+            outdata.fill(0)
+            return
+        outdata[:, 0] = block
+        self._free_blocks.put(block)
+    
+    def device_blocksize(self):
+        """
+        Return self.blocksize, raised to at least the output device's default
+        low-latency buffer and rounded up to an even number of frames.
+        """
+        import sounddevice as sd
+        
+        info = sd.query_devices(self.device, 'output')
+        min_frames = int(np.ceil(info['default_low_output_latency']
+                                 * self.sample_rate))
+        blocksize = max(self.blocksize, min_frames)
+        return blocksize + blocksize % 2
     
     def toggle_playback(self):
         if not self.is_playing:
-            self.is_playing = True
-            self.play_button.config(text="Stop")
-            self.status_label.config(text="Playing")
+            import sounddevice as sd
+            
+            # Wait for the kernel, then publish again from this thread: a
+            # slider move racing the loader could have published a snapshot
+            # without it.
+            self._kernel_loader.join()
+            self._publish_params()
+            # Don't ask for blocks shorter than the device's low-latency
+            # buffer, and keep them even for Box-Muller. The closed-form
+            # tables are sized from the blocksize, so rebuild them if it moved.
+            blocksize = self.device_blocksize()
+            if blocksize != self.blocksize:
+                self.blocksize = blocksize
+                self._last_bass = None
+                self.update_leak_from_bass(self.bass_level)
+            # Scratch buffers for the producer are allocated once per stream,
+            # cache-line aligned for the vectorized math in render_block.
+            self._u = _aligned_empty(self.blocksize)
+            self._u1 = self._u[:self.blocksize // 2]
+            self._u2 = self._u[self.blocksize // 2:]
+            self._r = _aligned_empty(self.blocksize // 2)
+            self._white = _aligned_empty(self.blocksize)
+            self._brown = _aligned_empty(self.blocksize)
+            # Blocks cycle between the producer and the callback through
+            # these two queues, so steady-state playback allocates nothing.
+            self._free_blocks = queue.SimpleQueue()
+            self._ready_blocks = queue.SimpleQueue()
+            self._underflows = 0
+            for _ in range(_PREFETCH_BLOCKS):
+                self._free_blocks.put(
+                    _aligned_empty(self.blocksize, dtype=np.int16))
+            # Open the stream before starting the producer, so a bad device
+            # (here or in device_blocksize) leaves no thread behind.
             self.stream = sd.OutputStream(
                 samplerate=self.sample_rate,
                 channels=1,
                 callback=self.audio_callback,
                 device=self.device,
-                blocksize=2048,  # Larger block size can improve stability
-                latency='high'
+                blocksize=self.blocksize,
+                latency='low',
+                # We quantize while rendering, so the device gets int16 as-is.
+                dtype='int16'
             )
-            self.stream.start()
+            self.is_playing = True
+            self._producer = threading.Thread(target=self.produce_blocks,
+                                              daemon=True)
+            self._producer.start()
+            try:
+                self.stream.start()
+            except Exception:
+                self.is_playing = False
+                self._producer.join()
+                self.stream.close()
+                raise
+            self.play_button.config(text="Stop")
+            self.status_label.config(text="Playing")
         else:
             self.is_playing = False
             self.play_button.config(text="Start")
@@ -168,6 +480,8 @@ class BrownNoiseGenerator:
             if hasattr(self, 'stream'):
                 self.stream.stop()
                 self.stream.close()
+            if hasattr(self, '_producer'):
+                self._producer.join()
     
     def on_close(self):
         if self.is_playing: